@@ -6,11 +6,199 @@ import time
 import threading
 import queue
 from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
 from PIL import Image, ImageTk
 import math
 import os
+import urllib.request
+
+try:
+    import numba
+    # The kernels get called from the grabber and feature pool threads. TBB hangs the interpreter on
+    # exit once a worker thread has used it and workqueue can't be used from two threads at once,
+    # so prefer OpenMP
+    numba.config.THREADING_LAYER_PRIORITY = ["omp", "tbb", "workqueue"]
+except ImportError:  # numba is optional, the numpy path below still works without it
+    numba = None
+
+if numba is not None:
+    @numba.njit(parallel=True, nogil=True, fastmath=True, cache=True)
+    def _build_cyl_maps(map_x, map_y, w, h, focal_length):
+        # Same math as the numpy path in build_cylindrical_maps, just fused into one pass
+        for y in numba.prange(h):
+            y_c = y - h / 2
+            for x in range(w):
+                x_c = x - w / 2
+                map_x[y, x] = focal_length * (x_c / focal_length) + w / 2
+                map_y[y, x] = y_c / math.sqrt(x_c * x_c + focal_length * focal_length) * focal_length + h / 2
+    
+    @numba.njit(parallel=True, nogil=True, fastmath=True, cache=True)
+    def _brightness_contrast(src, dst, alpha, beta):
+        # Matches cv2.convertScaleAbs to within 1 level (it rounds in float32), multiply, add, abs and
+        # saturate in one pass
+        h, w, c = src.shape
+        for y in numba.prange(h):
+            for x in range(w):
+                for ch in range(c):
+                    v = abs(src[y, x, ch] * alpha + beta)
+                    dst[y, x, ch] = min(255, round(v))
+    
+    @numba.njit(parallel=True, nogil=True, fastmath=True, cache=True)
+    def _luma_thumbnail(frame, out, stride):
+        # Average every stride-th pixel of each block of the BGR frame straight into luma,
+        # one pass with no full size temporaries
+        h, w = frame.shape[0], frame.shape[1]
+        out_h, out_w = out.shape
+        for oy in numba.prange(out_h):
+            y0 = oy * h // out_h
+            y1 = (oy + 1) * h // out_h
+            for ox in range(out_w):
+                x0 = ox * w // out_w
+                x1 = (ox + 1) * w // out_w
+                acc = 0.0
+                n = 0
+                for y in range(y0, y1, stride):
+                    for x in range(x0, x1, stride):
+                        acc += 0.114 * frame[y, x, 0] + 0.587 * frame[y, x, 1] + 0.299 * frame[y, x, 2]
+                        n += 1
+                out[oy, ox] = acc / n
+    
+    def _warm_up_kernels():
+        # Compiling (or loading from the on-disk cache) happens on the first call, so get it
+        # over with on a tiny input before the grabber or a settings change needs them
+        try:
+            frame = np.zeros((4, 4, 3), np.uint8)
+            _brightness_contrast(frame, frame, 1.0, 0.0)
+            _luma_thumbnail(frame, np.empty((2, 2), np.float32), 1)
+            _build_cyl_maps(np.empty((4, 4), np.float32), np.empty((4, 4), np.float32), 4, 4, 2.0)
+        except Exception as e:
+            print(f"Numba warm up error: {e}")
+else:
+    _build_cyl_maps = None
+    _brightness_contrast = None
+    _luma_thumbnail = None
+    _warm_up_kernels = None
+
+try:
+    import largestinteriorrectangle as lir
+except ImportError:  # optional too, without it the crop falls back to the content's bounding box
+    lir = None
+
+try:
+    from turbojpeg import TurboJPEG, TJPF_BGR
+except ImportError:  # also optional, MJPEG URLs go through cv2.VideoCapture without it
+    TurboJPEG = None
+
+class MJPEGStream:
+    """Reads an MJPEG-over-HTTP stream and decodes it with libjpeg-turbo, same interface as the bits of cv2.VideoCapture we use"""
+    def __init__(self, url):
+        self._tj = TurboJPEG()
+        self._jpeg = None
+        self._jpeg_id = 0
+        self._grabbed_id = 0
+        self._grabbed = None
+        self._cond = threading.Condition()
+        self._open = True
+        self._stopping = False
+        try:
+            self._stream = urllib.request.urlopen(url, timeout=5)
+        except Exception as e:
+            print(f"MJPEG connect error: {e}")
+            self._stream = None
+            self._open = False
+            return
+        if not self._stream.headers.get_content_type().startswith('multipart/'):
+            # Not multipart MJPEG (H.264 over HTTP, a single JPEG endpoint...), isOpened() says False
+            # and the caller falls back to cv2.VideoCapture
+            self._stream.close()
+            self._stream = None
+            self._open = False
+            return
+        # Keep reading parts in the background and only hold on to the newest one, decoding only
+        # happens in retrieve() so frames nobody asks for cost next to nothing
+        threading.Thread(target=self._read_loop, daemon=True).start()
+        
+    def _read_loop(self):
+        try:
+            while self._open:
+                jpeg = self._read_part()
+                if jpeg is None:
+                    break
+                with self._cond:
+                    self._jpeg = jpeg
+                    self._jpeg_id += 1
+                    self._cond.notify_all()
+        except Exception as e:
+            # release() closing the response under us is a normal disconnect, not an error
+            if not self._stopping:
+                print(f"MJPEG read error: {e}")
+        with self._cond:
+            self._open = False
+            self._cond.notify_all()
+            
+    def _read_part(self):
+        # Each part is a boundary line, some headers and a blank line, then Content-Length bytes of JPEG
+        length = None
+        while True:
+            raw = self._stream.readline()
+            if not raw:
+                return None
+            line = raw.strip()
+            if line.lower().startswith(b'content-length:'):
+                length = int(line.split(b':', 1)[1])
+            elif not line and length is not None:
+                return self._stream.read(length)
+            elif line.startswith(b'\xff\xd8'):
+                # No Content-Length header, fall back to reading up to the JPEG end marker
+                data = bytearray(raw)
+                end = data.find(b'\xff\xd9')
+                while end < 0:
+                    chunk = self._stream.readline()
+                    if not chunk:
+                        return None
+                    # Only search the new bytes, plus one in case the marker got split across reads
+                    start = max(0, len(data) - 1)
+                    data += chunk
+                    end = data.find(b'\xff\xd9', start)
+                return bytes(data[:end + 2])
+                
+    def isOpened(self):
+        return self._open
+        
+    def set(self, prop, value):
+        return False
+        
+    def grab(self):
+        with self._cond:
+            # Wait for a part we haven't handed out yet
+            if not self._cond.wait_for(lambda: self._jpeg_id != self._grabbed_id or not self._open, timeout=1.0):
+                return False
+            if self._jpeg_id == self._grabbed_id:
+                return False
+            self._grabbed, self._grabbed_id = self._jpeg, self._jpeg_id
+        return True
+        
+    def retrieve(self):
+        if self._grabbed is None:
+            return False, None
+        try:
+            return True, self._tj.decode(self._grabbed, pixel_format=TJPF_BGR)
+        except Exception as e:
+            print(f"MJPEG decode error: {e}")
+            return False, None
+            
+    def read(self):
+        if not self.grab():
+            return False, None
+        return self.retrieve()
+        
+    def release(self):
+        self._stopping = True
+        self._open = False
+        if self._stream is not None:
+            self._stream.close()
 
 class ContinuousPanoramaGUI:
     def __init__(self, root):
@@ -21,20 +209,58 @@ class ContinuousPanoramaGUI:
         
         self.cap = None
         # Use cylindrical stitcher for 360-degree panoramas cause otherwise it gets reeeeal confused
-        self.stitcher = cv2.Stitcher.create(cv2.Stitcher_SCANS)
-        self.frames = []
+        # PANORAMA mode warps the frames itself (spherical, ORB features), so frames go in unwarped.
+        # The python bindings don't expose setWarper/setFeaturesFinder so those defaults are what we get
+        self.stitcher = cv2.Stitcher.create(cv2.Stitcher_PANORAMA)
+        # The live preview restitches all the time, so trade some quality for speed there: register
+        # and find seams on smaller images and skip wave correction. end_and_save redoes it properly
+        self.stitcher.setRegistrationResol(0.3)
+        self.stitcher.setSeamEstimationResol(0.05)
+        self.stitcher.setWaveCorrection(False)
+        # Accept slightly shakier matches so a frame doesn't get dropped just for being low on texture
+        self.stitcher.setPanoConfidenceThresh(0.8)
+        self.hq_stitcher = None
+        # Stitch on the GPU through OpenCL when there's a device for it, otherwise stay on the CPU
+        cv2.ocl.setUseOpenCL(True)
+        self.use_opencl = cv2.ocl.haveOpenCL()
         self.running = False
         self.auto_mode = False
-        self.frame_queue = queue.Queue(maxsize=5)
+        # Only the newest camera frame matters, so keep a single slot instead of a queue
+        self._latest_frame = None
+        self.latest_frame_lock = threading.Lock()
+        # Set when the UI has taken the last frame and wants another one, the grabber sleeps until then
+        self._frame_wanted = threading.Event()
+        # True while an update_camera_view call is already queued for the Tk thread
+        self._camera_refresh_pending = False
         self.current_frame = None
-        self.previous_frame = None
+        # Every new camera frame also goes to auto_capture_loop along with its small float32 luma thumbnail.
+        # Bounded so a slow scene check drops frames instead of piling them up
+        self.scene_queue = queue.Queue(maxsize=2)
+        self.previous_scene_thumb = None
         self.total_frames = 0
         
         self.current_panorama = None
         self.panorama_lock = threading.Lock()
+        self.reset_stitch_state()
         
+        # Sideways shift since the last captured frame, in percent of the frame width
         self.scene_change_threshold = 25.0
+        # Phase correlation on the thumbnail wraps around past about half a frame, so a threshold
+        # above ~45% could never be reached. Keep it inside this range
+        self.scene_change_range = (5.0, 40.0)
+        self.scene_change_size = (64, 64)
+        # Mean absolute luma difference, as a fraction of the thumbnails' own contrast, below which the
+        # view counts as not having moved at all. Relative so flat murky scenes still get correlated
+        self.scene_still_sad = 0.1
+        sc_w, sc_h = self.scene_change_size
+        self._pc1 = np.empty((sc_h, sc_w), np.float32)
+        self._pc2 = np.empty((sc_h, sc_w), np.float32)
+        self._pc_window = cv2.createHanningWindow(self.scene_change_size, cv2.CV_32F)
         self.capture_interval = 1.5
+        # If this many checks in a row stay under the threshold, capture the one that moved the most
+        self.max_capture_candidates = 45  # about 1.5s at 30fps
+        self._best_candidate = None
+        self._candidates_checked = 0
         self.last_capture_time = 0
         self.min_frames_before_stitch = 3
         self.brightness = 0
@@ -46,21 +272,111 @@ class ContinuousPanoramaGUI:
         self.cylindrical_projection = True
         self.max_frames_for_360 = 50  # Limit frames to prevent memory issues maybe a non issue
         self.overlap_threshold = 0.3  # For detecting full circle completion
+        # Size of the mask the border crop gets worked out on, in pixels
+        self.crop_mask_pixels = 250000
+        
+        # Only the newest max_frames_for_360 frames are kept, older ones fall off the front
+        self.frames = deque(maxlen=self.max_frames_for_360)
+        self.frames_lock = threading.Lock()
+        # Backing store for self.frames, allocated on the first capture once the frame size is known
+        self._frames_buf = None
+        # Futures for each frame's chain features, computed in the background while we wait for the next capture
+        self.frame_features = deque(maxlen=self.max_frames_for_360)
+        # On the cv2.Stitcher path each frame is uploaded to the OpenCL device once when it's captured,
+        # so restitching doesn't copy every frame over again
+        self.frame_umats = deque(maxlen=self.max_frames_for_360)
+        self._feature_pool = ThreadPoolExecutor(max_workers=max(1, (os.cpu_count() or 2) // 2))
+        
+        # Cylindrical remap tables only depend on frame size, so build them once per (h, w)
+        self._cyl_maps = None
+        self._cyl_maps_key = None
         
         self.continuous_stitching = True
+        # Chain pairwise homographies between consecutive frames instead of running cv2.Stitcher,
+        # we only ever rotate so there's no need for its full bundle adjustment every time
+        self.use_homography_chain = True
+        # With cv2.Stitcher, new frames get stitched pairwise onto the panorama and every so often
+        # the whole set is redone from scratch so the pairwise errors don't pile up
+        self.full_restitch_every = 10
         self.stitch_queue = queue.Queue()
+        # Saves queued up by end_and_save, handled by writer_loop. unfinished_tasks counts the ones
+        # not written yet, on_closing waits for those
+        self.writer_queue = queue.Queue()
+        self.writer_thread = None
+        self._closing = False
         self.stitching_in_progress = False
         
         self.camera_display_width = 640
         self.camera_display_height = 480
+        self._camera_photo = None
+        self._display_buf = None
+        self._overlay_text_frames = None
+        self._overlay_text = None
+        self._pano_photo = None
+        self._pano_image_id = None
+        self._pano_display_buf = None
+        # How much of the panorama PhotoImage holds real panorama, the rest of it is black
+        self._pano_display_w = 0
         self.pano_display_height = 350
         
-        # Feature detector for the newish 360 mode
-        self.feature_detector = cv2.SIFT_create()
-        self.feature_matcher = cv2.BFMatcher()
+        # Feature detector for the newish 360 mode, ORB + hamming is way cheaper than SIFT + L2.
+        # Only built the first time something asks for it, see feature_detector
+        self._feature_detector = None
+        self.feature_matcher = cv2.BFMatcher(cv2.NORM_HAMMING, crossCheck=True)
+        self._first_frame_feats = None
+        
+        # Worker threads queue their widget updates here and the Tk thread runs them in batches. A drain
+        # only gets scheduled when something is queued, so there are no wakeups while nothing happens
+        self._ui_queue = queue.SimpleQueue()
+        self._ui_lock = threading.Lock()
+        self._ui_drain_pending = False
+        
+        if _warm_up_kernels is not None:
+            threading.Thread(target=_warm_up_kernels, daemon=True).start()
         
         self.setup_ui()
         
+    @property
+    def feature_detector(self):
+        if self._feature_detector is None:
+            self._feature_detector = cv2.ORB_create(500, scaleFactor=1.2, nlevels=4)
+        return self._feature_detector
+        
+    def _ui(self, fn):
+        self._ui_queue.put(fn)
+        # One pending drain picks up everything queued before it runs
+        with self._ui_lock:
+            if self._ui_drain_pending:
+                return
+            self._ui_drain_pending = True
+        try:
+            self.root.after(0, self.drain_ui_queue)
+        except (RuntimeError, tk.TclError):
+            # The window is already gone
+            pass
+        
+    def drain_ui_queue(self, max_jobs=50):
+        # Clear the flag first so anything queued while we're draining schedules another drain
+        with self._ui_lock:
+            self._ui_drain_pending = False
+        for _ in range(max_jobs):
+            try:
+                fn = self._ui_queue.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                fn()
+            except Exception as e:
+                print(f"UI update error: {e}")
+        
+        # Hit the batch limit, give Tk a chance to redraw and come back for the rest
+        if not self._ui_queue.empty():
+            with self._ui_lock:
+                if self._ui_drain_pending:
+                    return
+                self._ui_drain_pending = True
+            self.root.after(1, self.drain_ui_queue)
+        
     def setup_ui(self):
         main_frame = tk.Frame(self.root, bg='#000000')
         main_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
@@ -206,7 +522,17 @@ class ContinuousPanoramaGUI:
                 self.cap = cv2.VideoCapture(0)
                 connection_type = "webcam"
             else:
-                self.cap = cv2.VideoCapture(self.camera_source)
+                self.cap = None
+                if TurboJPEG is not None and self.camera_source.lower().startswith(('http://', 'https://')):
+                    # libjpeg-turbo decodes straight to BGR without going through ffmpeg's demuxer
+                    try:
+                        self.cap = MJPEGStream(self.camera_source)
+                    except Exception as e:  # PyTurboJPEG is there but libturbojpeg itself isn't
+                        print(f"libjpeg-turbo unavailable, using cv2.VideoCapture: {e}")
+                    if self.cap is not None and not self.cap.isOpened():
+                        self.cap = None
+                if self.cap is None:
+                    self.cap = cv2.VideoCapture(self.camera_source)
                 connection_type = "MJPEG stream"
                 
             if not self.cap.isOpened():
@@ -220,17 +546,42 @@ class ContinuousPanoramaGUI:
             self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
             
             if self.camera_source.lower() == "webcam":
+                # Ask for MJPG so USB cams don't fall back to raw YUV at 720p
+                self.cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*'MJPG'))
                 self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, 1280)
                 self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 720)
                 self.cap.set(cv2.CAP_PROP_FPS, 30)
             
             self.running = True
             self.auto_mode = True
-            self.frames.clear()
+            with self.frames_lock:
+                self.frames.clear()
+                self.frame_features.clear()
+                self.frame_umats.clear()
+                self._frames_buf = None
             self.current_panorama = None
             self.total_frames = 0
+            self.previous_scene_thumb = None
+            self._best_candidate = None
+            self._candidates_checked = 0
+            self._first_frame_feats = None
+            self.reset_stitch_state()
+            
+            # The last session's grabber may have left thumbnails, stitch requests and a frame behind,
+            # and the new auto loop would take them as its first reference
+            for q in (self.scene_queue, self.stitch_queue):
+                while True:
+                    try:
+                        q.get_nowait()
+                    except queue.Empty:
+                        break
+            with self.latest_frame_lock:
+                self._latest_frame = None
+                self._camera_refresh_pending = False
+            self.current_frame = None
             
             self.pano_canvas.delete("all")
+            self._pano_image_id = None
             
             self.connect_btn.configure(text="🔌 Disconnect", bg='#8E8E93')
             self.end_btn.configure(state=tk.NORMAL)
@@ -265,201 +616,326 @@ class ContinuousPanoramaGUI:
                 self.capture_frame_for_panorama()
                 self.status_label.configure(text="Initial frame captured!\nRotate slowly for 360°")
             
+    def wake_workers(self):
+        """Unblock the worker threads so they notice running or auto_mode went False"""
+        self._frame_wanted.set()
+        self.stitch_queue.put(None)
+        try:
+            self.scene_queue.put_nowait(None)
+        except queue.Full:
+            # Already has frames in it, so the auto capture loop is about to wake up anyway
+            pass
+            
     def disconnect_and_stop(self):
         self.running = False
         self.auto_mode = False
+        self.wake_workers()
         
         if self.cap:
             self.cap.release()
         
+        self._first_frame_feats = None
+        
         self.connect_btn.configure(text="🔌 Start Capture", bg='#007AFF')
         self.end_btn.configure(state=tk.DISABLED)
         self.clear_btn.configure(state=tk.DISABLED)
         self.status_label.configure(text="Configure settings\nthen start capture")
         self.camera_label.configure(image='', text="Camera view will appear here")
+        self._camera_photo = None
         self.frame_count_label.configure(text="Frames: 0")
         self.stitch_status_label.configure(text="Stitching: Idle")
         self.progress_label.configure(text="360° Progress: 0%")
         
     def apply_brightness_contrast(self, frame):
         if self.brightness != 0 or self.contrast != 1.0:
-            frame = cv2.convertScaleAbs(frame, alpha=self.contrast, beta=self.brightness)
+            if _brightness_contrast is not None:
+                # Every cap.read() hands back a fresh array, so it's safe to adjust it in place
+                _brightness_contrast(frame, frame, float(self.contrast), float(self.brightness))
+            else:
+                frame = cv2.convertScaleAbs(frame, alpha=self.contrast, beta=self.brightness)
         return frame
         
     def capture_frames(self):
+        # Only decode frames when the UI asks for one. MJPEGStream keeps reading on its own thread and
+        # always hands back the newest part, so it doesn't even need grabbing in between. Backends that
+        # ignore BUFFERSIZE (FFmpeg URLs, MSMF webcams) queue frames up though, so cv2.VideoCapture
+        # sources keep getting grab()bed and only retrieve() waits for the UI
+        on_demand = isinstance(self.cap, MJPEGStream)
+        self._frame_wanted.set()
         while self.running:
-            ret, frame = self.cap.read()
-            if ret:
-                frame = self.apply_brightness_contrast(frame)
-                try:
-                    self.frame_queue.put(frame, block=False)
-                except queue.Full:
-                    try:
-                        self.frame_queue.get_nowait()
-                        self.frame_queue.put(frame, block=False)
-                    except queue.Empty:
-                        pass
-            time.sleep(0.03)
-            
-    def update_camera_view(self):
-        if not self.running:
-            return
-            
-        try:
-            frame = self.frame_queue.get_nowait()
-            self.current_frame = frame.copy()
-            
-            display_frame = self.resize_for_display(frame, 
-                                                  max_width=self.camera_display_width, 
-                                                  max_height=self.camera_display_height)
-            
-            if self.auto_mode:
-                display_frame = self.add_capture_overlay(display_frame)
+            if on_demand:
+                self._frame_wanted.wait()
+                if not self.running:
+                    break
+                
+            # grab() blocks until the camera has a frame, so there's no need to pace this loop ourselves
+            if not self.cap.grab():
+                # Camera or stream dropped out, back off a bit instead of spinning on it
+                time.sleep(0.03)
+                continue
             
-            image = cv2.cvtColor(display_frame, cv2.COLOR_BGR2RGB)
-            image = Image.fromarray(image)
-            photo = ImageTk.PhotoImage(image)
+            if not self._frame_wanted.is_set():
+                # Nobody wants this one, the grab just keeps the backend's queue from backing up
+                continue
+                
+            ret, frame = self.cap.retrieve()
+            if not ret:
+                # Just a bad decode, try the next frame straight away
+                continue
+                
+            self._frame_wanted.clear()
+            frame = self.apply_brightness_contrast(frame)
+            thumb = self.make_scene_thumbnail(frame)
+            # Build the preview image here too so the Tk thread only has to paste it
+            image = self.make_preview_image(frame)
+            with self.latest_frame_lock:
+                self._latest_frame = (frame, image)
+                # The preview only refreshes when there's a frame for it, and one queued refresh is enough
+                queue_refresh = not self._camera_refresh_pending
+                self._camera_refresh_pending = True
+            if queue_refresh:
+                self._ui(self.update_camera_view)
+            try:
+                self.scene_queue.put_nowait((frame, thumb))
+            except queue.Full:
+                pass
             
-            self.camera_label.configure(image=photo, text='')
-            self.camera_label.image = photo
+    def update_camera_view(self):
+        with self.latest_frame_lock:
+            latest, self._latest_frame = self._latest_frame, None
+            self._camera_refresh_pending = False
             
-        except queue.Empty:
-            pass
+        if latest is not None and self.running:
+            # Start on the next frame while we draw this one
+            self._frame_wanted.set()
+            frame, image = latest
+            # retrieve() hands back a new array every time and nothing writes to it after it's published,
+            # so current_frame can just hold on to it
+            self.current_frame = frame
             
-        self.root.after(33, self.update_camera_view)
+            w, h = image.size
+            # Reuse one PhotoImage and paste into it rather than making a new Tk image every tick
+            if self._camera_photo is None or (self._camera_photo.width(), self._camera_photo.height()) != (w, h):
+                self._camera_photo = ImageTk.PhotoImage(image)
+                self.camera_label.configure(image=self._camera_photo, text='')
+                self.camera_label.image = self._camera_photo
+            else:
+                self._camera_photo.paste(image)
+        
+    def make_preview_image(self, frame):
+        """Shrink a camera frame for the preview, draw the overlay and turn it into a PIL image, runs on the grabber thread"""
+        display_frame = self.resize_for_display(frame, 
+                                              max_width=self.camera_display_width, 
+                                              max_height=self.camera_display_height)
+        
+        if self.auto_mode:
+            display_frame = self.add_capture_overlay(display_frame)
+        
+        # PIL can read BGR directly, so there's no need for a cvtColor here. The raw decoder copies
+        # out of the display buffer, so the next frame can reuse it straight away
+        h, w = display_frame.shape[:2]
+        return Image.frombuffer('RGB', (w, h), np.ascontiguousarray(display_frame), 'raw', 'BGR', 0, 1)
         
     def resize_for_display(self, frame, max_width=600, max_height=400):
         h, w = frame.shape[:2]
         scale = min(max_width/w, max_height/h)
         if scale < 1:
             new_w, new_h = int(w*scale), int(h*scale)
-            return cv2.resize(frame, (new_w, new_h))
+            # Reuse the same preview buffer every tick, Tk copies out of it on paste anyway
+            if self._display_buf is None or self._display_buf.shape[:2] != (new_h, new_w):
+                self._display_buf = np.empty((new_h, new_w) + frame.shape[2:], np.uint8)
+            return cv2.resize(frame, (new_w, new_h), dst=self._display_buf, interpolation=cv2.INTER_AREA)
         return frame
         
     def add_capture_overlay(self, frame):
-        overlay = frame.copy()
+        # The resized preview buffer is ours to scribble on, only a full size frame (which is also
+        # current_frame) needs copying first
+        overlay = frame if frame is self._display_buf else frame.copy()
         h, w = frame.shape[:2]
         
         circle_radius = 8
         font_scale = 0.6
         thickness = 2
         
+        # The strings only change when a frame gets captured, not every preview tick
+        if self._overlay_text_frames != self.total_frames:
+            self._overlay_text_frames = self.total_frames
+            # Add rotation indicator
+            progress = min(100, (self.total_frames / 30) * 100)  # Estimate progress, thisll change with the actual bot but this is what it is for my 480p webcam
+            self._overlay_text = (f"Frames: {self.total_frames}", f"Progress: {progress:.0f}%")
+        frames_text, progress_text = self._overlay_text
+        
         cv2.circle(overlay, (20, 20), circle_radius, (0, 0, 255), -1)
         cv2.putText(overlay, "Recording", (35, 25), cv2.FONT_HERSHEY_SIMPLEX, font_scale, (0, 0, 255), thickness)
-        
-        text = f"Frames: {self.total_frames}"
-        cv2.putText(overlay, text, (10, h-10), cv2.FONT_HERSHEY_SIMPLEX, font_scale, (0, 255, 0), thickness)
-        
-        # Add rotation indicator
-        progress = min(100, (self.total_frames / 30) * 100)  # Estimate progress, thisll change with the actual bot but this is what it is for my 480p webcam
-        cv2.putText(overlay, f"Progress: {progress:.0f}%", (10, h-30), cv2.FONT_HERSHEY_SIMPLEX, font_scale, (255, 255, 0), thickness)
+        cv2.putText(overlay, frames_text, (10, h-10), cv2.FONT_HERSHEY_SIMPLEX, font_scale, (0, 255, 0), thickness)
+        cv2.putText(overlay, progress_text, (10, h-30), cv2.FONT_HERSHEY_SIMPLEX, font_scale, (255, 255, 0), thickness)
         
         return overlay
         
     def auto_capture_loop(self):
+        # Blocks on the grabber instead of polling, so every check is on a frame we haven't seen yet
         while self.auto_mode and self.running:
-            try:
-                if self.current_frame is not None:
-                    self.process_frame_for_capture()
-                    
-                time.sleep(0.1)
+            item = self.scene_queue.get()
+            if item is None:
+                # wake_workers, go round and check whether we should stop
+                continue
+            current_frame, current_thumb = item
                 
+            try:
+                self.process_frame_for_capture(current_frame, current_thumb)
             except Exception as e:
                 print(f"Auto capture loop error: {e}")
                 
-    def process_frame_for_capture(self):
+    def process_frame_for_capture(self, current_frame, current_thumb):
         current_time = time.time()
         
         if current_time - self.last_capture_time < self.capture_interval:
             return
             
-        # Stop capturing if we have too many frames so no memory issues please :3
-        if self.total_frames >= self.max_frames_for_360:
+        if self.previous_scene_thumb is None:
+            self.previous_scene_thumb = current_thumb
             return
             
-        if self.previous_frame is not None:
-            change_score = self.calculate_scene_change(self.previous_frame, self.current_frame)
-            
-            if change_score > self.scene_change_threshold:
-                self.capture_frame_for_panorama()
-                self.last_capture_time = current_time
-                
-        self.previous_frame = self.current_frame.copy()
-        
-    def calculate_scene_change(self, frame1, frame2):
-        h1, w1 = frame1.shape[:2]
-        if w1 > 320:
-            scale = 320 / w1
-            new_w, new_h = int(w1 * scale), int(h1 * scale)
-            frame1 = cv2.resize(frame1, (new_w, new_h))
-            frame2 = cv2.resize(frame2, (new_w, new_h))
+        change_score = self.calculate_scene_change(self.previous_scene_thumb, current_thumb)
         
-        gray1 = cv2.cvtColor(frame1, cv2.COLOR_BGR2GRAY)
-        gray2 = cv2.cvtColor(frame2, cv2.COLOR_BGR2GRAY)
-        
-        diff = cv2.absdiff(gray1, gray2)
+        if change_score > self.scene_change_threshold:
+            self.capture_frame_for_panorama(current_frame)
+        else:
+            # Low texture scenes can keep the measured shift under the threshold even while we're turning,
+            # so remember the best frame so far and take it if nothing better shows up for a while
+            if self._best_candidate is None or change_score > self._best_candidate[0]:
+                self._best_candidate = (change_score, current_frame, current_thumb)
+            self._candidates_checked += 1
+            if self._candidates_checked < self.max_capture_candidates:
+                return
+            change_score, current_frame, current_thumb = self._best_candidate
+            if change_score < self.scene_change_threshold / 2:
+                # Not really moving, start looking again
+                self._best_candidate = None
+                self._candidates_checked = 0
+                return
+            self.capture_frame_for_panorama(current_frame)
+            
+        self.last_capture_time = current_time
+        # Measure the next shift from the frame we just captured
+        self.previous_scene_thumb = current_thumb
+        self._best_candidate = None
+        self._candidates_checked = 0
+        
+    def make_scene_thumbnail(self, frame):
+        """Shrink a BGR frame to a scene_change_size float32 luma thumbnail"""
+        sc_w, sc_h = self.scene_change_size
+        thumb = np.empty((sc_h, sc_w), np.float32)
+        if _luma_thumbnail is not None:
+            # Every other pixel is plenty for a 64x64 thumbnail and reads a quarter of the frame
+            _luma_thumbnail(frame, thumb, 2)
+        else:
+            small = cv2.resize(frame, self.scene_change_size, interpolation=cv2.INTER_AREA)
+            np.copyto(thumb, cv2.cvtColor(small, cv2.COLOR_BGR2GRAY))
+        return thumb
+        
+    def calculate_scene_change(self, thumb1, thumb2):
+        """How far the view moved sideways between two scene thumbnails, as a percent of the frame width"""
+        # One SIMD absdiff+sum pass is way cheaper than the FFTs, if the thumbnails barely differ
+        # compared to how much contrast they have the camera hasn't moved and there's nothing to correlate
+        sad = cv2.norm(thumb1, thumb2, cv2.NORM_L1) / thumb1.size
+        contrast = max(cv2.meanStdDev(thumb1)[1][0, 0], cv2.meanStdDev(thumb2)[1][0, 0])
+        if sad < self.scene_still_sad * contrast:
+            return 0.0
+            
+        # phaseCorrelate applies the window to its inputs in place, so hand it scratch copies
+        np.copyto(self._pc1, thumb1)
+        np.copyto(self._pc2, thumb2)
         
-        mean_diff = np.mean(diff)
+        # Phase correlation gives the actual shift, so lighting changes don't trigger captures
+        (dx, dy), _ = cv2.phaseCorrelate(self._pc1, self._pc2, self._pc_window)
         
-        return mean_diff
+        return abs(dx) / self.scene_change_size[0] * 100
         
-    def apply_cylindrical_projection(self, frame):
-        """Apply cylindrical projection to the frame for better 360-degree stitching"""
+    def apply_cylindrical_projection(self, frame, size=None):
+        """Apply cylindrical projection to the frame for better 360-degree stitching, size is needed for UMat frames"""
         if not self.cylindrical_projection:
             return frame
             
-        h, w = frame.shape[:2]
+        w, h = size if size is not None else (frame.shape[1], frame.shape[0])
         
-        # Calculate focal length (aaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaa)
-        focal_length = w / (2 * np.tan(np.pi / 6.85))  # Assuming 68.5-degree FOV cause there's one chiefdelphi thread from a while ago saying that
+        if self._cyl_maps is None or self._cyl_maps_key != (h, w):
+            self._cyl_maps = self.build_cylindrical_maps(w, h)
+            self._cyl_maps_key = (h, w)
         
-        # Create coordinate matrices
-        x, y = np.meshgrid(np.arange(w), np.arange(h))
-        
-        # Convert to cylindrical coordinates
-        x_c = x - w / 2
-        y_c = y - h / 2
-        
-        # Apply cylindrical projection
-        theta = x_c / focal_length
-        h_cyl = y_c / np.sqrt(x_c**2 + focal_length**2) * focal_length
-        
-        # Convert back to image coordinates
-        x_new = focal_length * theta + w / 2
-        y_new = h_cyl + h / 2
-        
-        # Create maps for remapping
-        map_x = x_new.astype(np.float32)
-        map_y = y_new.astype(np.float32)
+        map1, map2 = self._cyl_maps
         
         # Remap the image
-        projected = cv2.remap(frame, map_x, map_y, cv2.INTER_LINEAR, borderMode=cv2.BORDER_CONSTANT)
+        projected = cv2.remap(frame, map1, map2, cv2.INTER_LINEAR, borderMode=cv2.BORDER_CONSTANT)
         
         return projected
         
-    def capture_frame_for_panorama(self):
-        if self.current_frame is None:
+    def build_cylindrical_maps(self, w, h):
+        """Build fixed-point remap tables for the cylindrical projection of a w x h frame"""
+        # Calculate focal length (aaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaa)
+        focal_length = w / (2 * np.tan(np.pi / 6.85))  # Assuming 68.5-degree FOV cause there's one chiefdelphi thread from a while ago saying that
+        
+        if _build_cyl_maps is not None:
+            map_x = np.empty((h, w), np.float32)
+            map_y = np.empty((h, w), np.float32)
+            _build_cyl_maps(map_x, map_y, w, h, focal_length)
+        else:
+            # 1-D coordinates broadcast against each other, so no HxW int temporaries
+            focal = float(focal_length)
+            x_c = np.arange(w, dtype=np.float32) - w / 2
+            y_c = (np.arange(h, dtype=np.float32) - h / 2)[:, None]
+            
+            # Apply cylindrical projection, the scale only depends on the column
+            theta = x_c / focal
+            inv = focal / np.sqrt(x_c * x_c + focal * focal)
+            
+            # Convert back to image coordinates
+            map_x = np.ascontiguousarray(np.broadcast_to(focal * theta + w / 2, (h, w)))
+            map_y = y_c * inv + h / 2
+        
+        # CV_16SC2 maps are smaller and remap faster than float maps
+        return cv2.convertMaps(map_x, map_y, cv2.CV_16SC2)
+        
+    def capture_frame_for_panorama(self, frame=None):
+        # current_frame gets replaced, never written to, so holding the reference is enough
+        if frame is None:
+            frame = self.current_frame
+        if frame is None:
             return
             
-        frame = self.current_frame.copy()
         h, w = frame.shape[:2]
+        new_w, new_h = w, h
         if w > 800:
             scale = 800 / w
             new_w, new_h = int(w * scale), int(h * scale)
-            frame = cv2.resize(frame, (new_w, new_h))
-        
-        # Apply cylindrical projection for 360-degree mode
-        if self.enable_360_mode:
-            frame = self.apply_cylindrical_projection(frame)
+        shape = (new_h, new_w) + frame.shape[2:]
             
-        self.frames.append(frame)
-        self.total_frames += 1
+        with self.frames_lock:
+            if self._frames_buf is None or self._frames_buf.shape[1:] != shape:
+                self._frames_buf = np.empty((self.max_frames_for_360,) + shape, np.uint8)
+            # self.frames holds views into the buffer, not separate arrays. Once the deque is full
+            # the frame it evicts is the one that lived in this slot
+            slot = self.total_frames % self.max_frames_for_360
+            dst = self._frames_buf[slot]
+            if (new_w, new_h) != (w, h):
+                # Resize straight into the buffer slot, INTER_AREA also gives cleaner features when shrinking
+                cv2.resize(frame, (new_w, new_h), dst=dst, interpolation=cv2.INTER_AREA)
+            else:
+                dst[...] = frame
+            self.frames.append(dst)
+            if self.use_homography_chain:
+                self.frame_features.append(self._feature_pool.submit(self.compute_chain_features, self.frames[-1]))
+                self.frame_umats.append(None)
+            else:
+                self.frame_features.append(None)
+                self.frame_umats.append(cv2.UMat(dst) if self.use_opencl else None)
+            self.total_frames += 1
         
         # Calculate approximate progress
         progress = min(100, (self.total_frames / 30) * 100)
         
-        self.root.after(0, lambda: self.frame_count_label.configure(text=f"Frames: {self.total_frames}"))
-        self.root.after(0, lambda: self.progress_label.configure(text=f"360° Progress: {progress:.0f}%"))
+        self._ui(lambda: self.frame_count_label.configure(text=f"Frames: {self.total_frames}"))
+        self._ui(lambda: self.progress_label.configure(text=f"360° Progress: {progress:.0f}%"))
         
         if len(self.frames) >= self.min_frames_before_stitch:
             try:
@@ -476,18 +952,29 @@ class ContinuousPanoramaGUI:
         else:
             status = f"Frame {self.total_frames} captured\nNearly complete circle!"
             
-        self.root.after(0, lambda: self.status_label.configure(text=status))
+        self._ui(lambda: self.status_label.configure(text=status))
         
     def continuous_stitch_loop(self):
         while self.running:
             try:
-                self.stitch_queue.get(timeout=1.0)
+                self.stitch_queue.get()
+                # One stitch picks up every frame captured so far, so any other requests that piled up
+                # while the last stitch was running are covered by this one
+                while True:
+                    try:
+                        self.stitch_queue.get_nowait()
+                    except queue.Empty:
+                        break
+                if not self.running:
+                    continue
+                
+                if self.total_frames == self._frames_stitched:
+                    # Nothing new since the last stitch
+                    continue
                 
                 if not self.stitching_in_progress and len(self.frames) >= self.min_frames_before_stitch:
                     self.stitch_current_frames()
                     
-            except queue.Empty:
-                continue
             except Exception as e:
                 print(f"Stitch loop error: {e}")
                 
@@ -496,72 +983,252 @@ class ContinuousPanoramaGUI:
             return
             
         self.stitching_in_progress = True
-        self.root.after(0, lambda: self.stitch_status_label.configure(text="Stitching: Working...", fg='#FF9500'))
+        self._ui(lambda: self.stitch_status_label.configure(text="Stitching: Working...", fg='#FF9500'))
         
         try:
-            frame_list = self.frames.copy()
+            with self.frames_lock:
+                # self.frames are views into the ring buffer and the next capture past max_frames_for_360
+                # overwrites the oldest slot, so cv2.Stitcher gets its own copies of the frames it reads.
+                # The chain only reads the features made at capture time and the UMats are device copies
+                if self.use_homography_chain:
+                    frame_list = list(self.frames)
+                else:
+                    frame_list = [f if u is not None else f.copy() for f, u in zip(self.frames, self.frame_umats)]
+                feature_list = list(self.frame_features)
+                umat_list = list(self.frame_umats)
+                captured = self.total_frames
             
-            # For 360-degree panoramas, we might need to handle wraparound
-            if self.enable_360_mode and len(frame_list) > 10:
-                # Try to detect if we've completed a full circle
-                if self.detect_full_circle(frame_list):
-                    # Add some frames from the beginning to the end for better wraparound
-                    frame_list.extend(frame_list[:3])
+            with self.panorama_lock:
+                panorama = self.current_panorama
             
-            status, panorama = self.stitcher.stitch(frame_list)
+            if self.use_homography_chain:
+                stitched = False
+                for i in self.take_new_frames(frame_list, captured, feature_list):
+                    if self.register_frame(*feature_list[i].result()):
+                        stitched = True
+                    else:
+                        print("Skipping frame: couldn't register it against the previous one")
+                status = cv2.Stitcher_OK if stitched else cv2.Stitcher_ERR_HOMOGRAPHY_EST_FAIL
+                if stitched:
+                    # The canvas keeps getting drawn into, so hand out a copy
+                    panorama = self.chain_panorama()
+            else:
+                # Use the device copies made at capture time when we have them
+                inputs = [u if u is not None else f for f, u in zip(frame_list, umat_list)]
+                if panorama is None or captured - self._last_full_stitch >= self.full_restitch_every:
+                    # Nothing to build on yet or it's time for a refresh, so stitch everything we have from scratch
+                    status, result = self.run_stitcher(inputs)
+                    stitched = status == cv2.Stitcher_OK
+                    self._last_full_stitch = captured
+                    if stitched:
+                        self._pano_umat = result
+                        self._frames_stitched = captured
+                else:
+                    # Only add the frames that came in since the last stitch onto the running panorama,
+                    # which stays on the device between stitches
+                    stitched = False
+                    status = cv2.Stitcher_ERR_NEED_MORE_IMGS
+                    for i in self.take_new_frames(frame_list, captured):
+                        status, result = self.run_stitcher([self._pano_umat, inputs[i]])
+                        if status == cv2.Stitcher_OK:
+                            self._pano_umat = result
+                            stitched = True
+                        else:
+                            # Keep the previous composite and drop the frame that wouldn't fit
+                            print(f"Skipping frame: {self.get_stitch_error_message(status)}")
+                if stitched:
+                    # Download once for display and saving
+                    panorama = self._pano_umat.get() if isinstance(self._pano_umat, cv2.UMat) else self._pano_umat
             
-            if status == cv2.Stitcher_OK:
-                # Post-process for 360-degree panorama
-                if self.enable_360_mode:
-                    panorama = self.post_process_360_panorama(panorama)
-                
+            if stitched:
                 with self.panorama_lock:
                     self.current_panorama = panorama
                 
-                self.root.after(0, lambda: self.update_panorama_display(panorama))
-                self.root.after(0, lambda: self.stitch_status_label.configure(text="Stitching: Success", fg='#34C759'))
+                self._ui(lambda: self.update_panorama_display(panorama))
+                self._ui(lambda: self.stitch_status_label.configure(text="Stitching: Success", fg='#34C759'))
                 
             else:
                 error_msg = self.get_stitch_error_message(status)
                 print(f"Stitching failed: {error_msg}")
-                self.root.after(0, lambda: self.stitch_status_label.configure(text=f"Stitching: {error_msg}", fg='#FF3B30'))
+                self._ui(lambda: self.stitch_status_label.configure(text=f"Stitching: {error_msg}", fg='#FF3B30'))
                 
         except Exception as e:
             print(f"Stitching error: {e}")
-            self.root.after(0, lambda: self.stitch_status_label.configure(text="Stitching: Error", fg='#FF3B30'))
+            self._ui(lambda: self.stitch_status_label.configure(text="Stitching: Error", fg='#FF3B30'))
             
         finally:
             self.stitching_in_progress = False
             
-    def detect_full_circle(self, frames):
+    def reset_stitch_state(self):
+        # How many of the captured frames are already part of current_panorama
+        self._frames_stitched = 0
+        self._last_full_stitch = 0
+        # Latest cv2.Stitcher result, a UMat when stitching through OpenCL
+        self._pano_umat = None
+        self._circle_closed = False
+        
+        # Homography chain state, every H maps a frame into the first frame's coordinates
+        self._H_chain = []
+        self._chain_prev_feats = None
+        self._canvas = None
+        # World coordinates of the canvas's top left pixel, and of the part the panorama covers
+        self._canvas_origin = None
+        self._canvas_bounds = None
+        
+    def take_new_frames(self, frame_list, captured, feature_list=None):
+        """Return indices of the frames that haven't been stitched yet, plus the wraparound frames once we've gone full circle"""
+        # frame_list only holds the newest frames, so the unstitched ones are at the end of it
+        new_count = min(captured - self._frames_stitched, len(frame_list))
+        new_frames = list(range(len(frame_list) - new_count, len(frame_list)))
+        self._frames_stitched = captured
+        
+        # For 360-degree panoramas, we might need to handle wraparound
+        if self.enable_360_mode and len(frame_list) > 10 and not self._circle_closed:
+            # Try to detect if we've completed a full circle
+            if self.detect_full_circle(frame_list, feature_list):
+                # Add some frames from the beginning to the end for better wraparound
+                new_frames.extend(range(min(3, len(frame_list))))
+                self._circle_closed = True
+                
+        return new_frames
+        
+    def compute_chain_features(self, frame):
+        """Warp a captured frame for the homography chain and find its features, runs on the feature pool"""
+        h, w = frame.shape[:2]
+        if self.use_opencl:
+            # Run the warp, grey conversion and ORB through OpenCL, only the results come back
+            frame = cv2.UMat(frame)
+            
+        # After a cylindrical warp pure rotation is close to a plain shift, which keeps the chain from drifting
+        if self.cylindrical_projection:
+            frame = self.apply_cylindrical_projection(frame, (w, h))
+            
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        # Each task gets its own detector since these run in parallel
+        detector = cv2.ORB_create(500, scaleFactor=1.2, nlevels=4)
+        kp, des = detector.detectAndCompute(gray, None)
+        if isinstance(frame, cv2.UMat):
+            # The canvas lives in host memory, so the warped frame has to come back for compositing
+            frame = frame.get()
+            if isinstance(des, cv2.UMat):
+                des = des.get()
+        # Pull the keypoint coordinates out into an array here on the pool, so the stitch thread
+        # doesn't have to walk KeyPoint objects in python while it holds the GIL
+        pts = cv2.KeyPoint_convert(kp) if kp else np.empty((0, 2), np.float32)
+        return frame, pts, des
+        
+    def register_frame(self, frame, pts, des):
+        """Match a frame against the previous one and draw it onto the canvas, returns False if it didn't fit"""
+        if not self._H_chain:
+            H = np.eye(3)
+        else:
+            prev_pts, prev_des = self._chain_prev_feats
+            if des is None or prev_des is None:
+                return False
+                
+            matches = self.feature_matcher.match(des, prev_des)
+            if len(matches) < 10:
+                return False
+                
+            idx = np.array([(m.queryIdx, m.trainIdx) for m in matches])
+            src = pts[idx[:, 0]].reshape(-1, 1, 2)
+            dst = prev_pts[idx[:, 1]].reshape(-1, 1, 2)
+            H, _ = cv2.findHomography(src, dst, cv2.RANSAC, 3.0)
+            if H is None:
+                return False
+            H = self._H_chain[-1] @ H
+            
+        if not self.composite_frame(frame, H):
+            return False
+            
+        self._H_chain.append(H)
+        self._chain_prev_feats = (pts, des)
+        return True
+        
+    def composite_frame(self, frame, H):
+        """Warp a frame onto the canvas with H, growing the canvas if the frame lands outside it"""
+        h, w = frame.shape[:2]
+        corners = np.float32([[0, 0], [w, 0], [w, h], [0, h]]).reshape(-1, 1, 2)
+        warped = cv2.perspectiveTransform(corners, H).reshape(-1, 2)
+        
+        fx_min, fy_min = np.floor(warped.min(axis=0)).astype(int)
+        fx_max, fy_max = np.ceil(warped.max(axis=0)).astype(int)
+        x_min, y_min, x_max, y_max = fx_min, fy_min, fx_max, fy_max
+        if self._canvas_bounds is not None:
+            old_x_min, old_y_min, old_x_max, old_y_max = self._canvas_bounds
+            x_min, y_min = min(x_min, old_x_min), min(y_min, old_y_min)
+            x_max, y_max = max(x_max, old_x_max), max(y_max, old_y_max)
+            
+        # A bad homography blows the canvas up, way more than a full circle could ever need
+        if x_max - x_min > w * 20 or y_max - y_min > h * 4:
+            return False
+            
+        # The canvas is allocated with some slack around the panorama, so it only has to be
+        # reallocated and copied every few frames instead of on every one
+        if self._canvas is None:
+            needs_grow = True
+        else:
+            org_x, org_y = self._canvas_origin
+            alloc_h, alloc_w = self._canvas.shape[:2]
+            needs_grow = x_min < org_x or y_min < org_y or x_max > org_x + alloc_w or y_max > org_y + alloc_h
+        if needs_grow:
+            margin_x, margin_y = w * 2, h // 4
+            new_org_x, new_org_y = x_min - margin_x, y_min - margin_y
+            canvas = np.zeros((y_max - y_min + 2 * margin_y, x_max - x_min + 2 * margin_x, 3), np.uint8)
+            if self._canvas is not None:
+                # Move what we already have over to the bigger canvas
+                off_x, off_y = org_x - new_org_x, org_y - new_org_y
+                canvas[off_y:off_y + alloc_h, off_x:off_x + alloc_w] = self._canvas
+            self._canvas = canvas
+            self._canvas_origin = (new_org_x, new_org_y)
+        self._canvas_bounds = (x_min, y_min, x_max, y_max)
+        
+        # Only warp into the part of the canvas this frame covers, the rest of it can't change
+        org_x, org_y = self._canvas_origin
+        roi = self._canvas[fy_min - org_y:fy_max - org_y, fx_min - org_x:fx_max - org_x]
+        # Shift from first frame coordinates into that patch's coordinates
+        T = np.array([[1, 0, -fx_min], [0, 1, -fy_min], [0, 0, 1]], dtype=np.float64)
+        cv2.warpPerspective(frame, T @ H, (fx_max - fx_min, fy_max - fy_min), dst=roi,
+                            borderMode=cv2.BORDER_TRANSPARENT)
+        return True
+        
+    def chain_panorama(self):
+        """Copy of the part of the canvas the panorama actually covers"""
+        x_min, y_min, x_max, y_max = self._canvas_bounds
+        org_x, org_y = self._canvas_origin
+        return self._canvas[y_min - org_y:y_max - org_y, x_min - org_x:x_max - org_x].copy()
+        
+    def run_stitcher(self, images):
+        """Stitch with cv2.Stitcher, with OpenCL the result is left on the device as a UMat"""
+        # UMat inputs let the stitcher run its warp/blend steps through OpenCL
+        if self.use_opencl:
+            images = [img if isinstance(img, cv2.UMat) else cv2.UMat(img) for img in images]
+        
+        return self.stitcher.stitch(images)
+        
+    def detect_full_circle(self, frames, features=None):
         """Detect if we've completed a full 360-degree rotation by comparing first and last frames"""
         if len(frames) < 10:
             return False
             
         try:
-            # Compare first few frames with last few frames
-            first_frame = frames[0]
-            last_frame = frames[-1]
-            
-            # Convert to grayscale
-            gray1 = cv2.cvtColor(first_frame, cv2.COLOR_BGR2GRAY)
-            gray2 = cv2.cvtColor(last_frame, cv2.COLOR_BGR2GRAY)
-            
-            # Detect features
-            kp1, des1 = self.feature_detector.detectAndCompute(gray1, None)
-            kp2, des2 = self.feature_detector.detectAndCompute(gray2, None)
+            if features is not None and features[0] is not None:
+                # The chain already found features for every frame when it was captured, no need to find them again
+                _, _, des1 = features[0].result()
+                _, _, des2 = features[-1].result()
+            else:
+                # The first frame never changes during a session, so only compute its features once
+                if self._first_frame_feats is None:
+                    self._first_frame_feats = self.compute_circle_features(frames[0])
+                kp1, des1 = self._first_frame_feats
+                kp2, des2 = self.compute_circle_features(frames[-1])
             
             if des1 is not None and des2 is not None and len(des1) > 10 and len(des2) > 10:
-                # Match features
-                matches = self.feature_matcher.knnMatch(des1, des2, k=2)
+                # Match features, crossCheck already throws out the ambiguous ones
+                matches = self.feature_matcher.match(des1, des2)
                 
                 # Filter good matches
-                good_matches = []
-                for match_pair in matches:
-                    if len(match_pair) == 2:
-                        m, n = match_pair
-                        if m.distance < 0.7 * n.distance:
-                            good_matches.append(m)
+                good_matches = [m for m in matches if m.distance < 40]
                 
                 # If we have enough good matches, we might have completed a circle
                 if len(good_matches) > 20:
@@ -572,27 +1239,54 @@ class ContinuousPanoramaGUI:
             
         return False
         
+    def compute_circle_features(self, frame):
+        """Downscale a frame to 240px wide and grab its features for the closure check"""
+        h, w = frame.shape[:2]
+        if w > 240:
+            scale = 240 / w
+            new_w, new_h = int(w * scale), int(h * scale)
+            frame = cv2.resize(frame, (new_w, new_h))
+        
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        return self.feature_detector.detectAndCompute(gray, None)
+        
     def post_process_360_panorama(self, panorama):
         """Post-process the panorama for better 360-degree viewing"""
-#        try:
-            # Remove black borders
-#            gray = cv2.cvtColor(panorama, cv2.COLOR_BGR2GRAY)
-#            _, thresh = cv2.threshold(gray, 1, 255, cv2.THRESH_BINARY)
-#            contours, _ = cv2.findContours(thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        try:
+            # Remove black borders, working on a small mask since only the crop rectangle is needed
+            h, w = panorama.shape[:2]
+            scale = min(1.0, math.sqrt(self.crop_mask_pixels / (h * w)))
+            small = cv2.resize(panorama, (max(1, int(w * scale)), max(1, int(h * scale))),
+                               interpolation=cv2.INTER_NEAREST)
+            gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+            _, thresh = cv2.threshold(gray, 1, 255, cv2.THRESH_BINARY)
             
-#            if contours:
+            if lir is not None:
+                # Largest rectangle that's all panorama, so no black corners are left at all
+                x, y, rw, rh = lir.lir(thresh > 0)
+                # Scale back up and pull in a pixel so no black edge sneaks in from the small mask
+                x0, y0 = int(math.ceil((x + 1) / scale)), int(math.ceil((y + 1) / scale))
+                x1, y1 = int((x + rw - 1) / scale), int((y + rh - 1) / scale)
+            else:
+                contours, _ = cv2.findContours(thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+                if not contours:
+                    return panorama
                 # Find the largest contour (the panorama content)
-#                largest_contour = max(contours, key=cv2.contourArea)
-#                x, y, w, h = cv2.boundingRect(largest_contour)
+                largest_contour = max(contours, key=cv2.contourArea)
+                x, y, rw, rh = cv2.boundingRect(largest_contour)
+                x0, y0 = int(x / scale), int(y / scale)
+                x1, y1 = int(math.ceil((x + rw) / scale)), int(math.ceil((y + rh) / scale))
                 
-                # Crop to remove black borders
-#TODO                panorama = panorama[y:y+h, x:x+w]
+            if x1 - x0 < w // 4 or y1 - y0 < h // 4:
+                # Something went wrong, a crop that small would throw away most of the panorama
+                return panorama
                 
-#            return panorama
-        return panorama            
-#        except Exception as e:
-#            print(f"Post-processing error: {e}")
-#            return panorama
+            # Crop to remove black borders
+            return panorama[y0:y1, x0:x1]
+            
+        except Exception as e:
+            print(f"Post-processing error: {e}")
+            return panorama
         
     def get_stitch_error_message(self, status):
         error_messages = {
@@ -604,21 +1298,49 @@ class ContinuousPanoramaGUI:
         
     def update_panorama_display(self, panorama):
         try:
-            self.pano_canvas.delete("all")
-            
             h, w = panorama.shape[:2]
-            scale = self.pano_display_height / h
-            new_w, new_h = int(w * scale), int(h * scale)
-            display_pano = cv2.resize(panorama, (new_w, new_h))
+            # Set the height outright, int(h * (height / h)) can come out one short and flip the buffer size
+            new_h = self.pano_display_height
+            new_w = max(1, round(w * new_h / h))
+            
+            # The panorama gets wider every stitch, so keep one buffer with room to spare and resize into the left part of it
+            buf = self._pano_display_buf
+            if buf is None or buf.shape[0] != new_h:
+                buf = np.zeros((new_h, max(new_w, buf.shape[1] if buf is not None else 0), 3), np.uint8)
+                self._pano_display_buf = buf
+            elif buf.shape[1] < new_w:
+                # Only double when it actually needs to get wider
+                buf = np.zeros((new_h, max(new_w, 2 * buf.shape[1]), 3), np.uint8)
+                self._pano_display_buf = buf
+            cv2.resize(panorama, (new_w, new_h), dst=buf[:, :new_w], interpolation=cv2.INTER_AREA)
+            
+            # The PhotoImage is as big as the whole buffer, the scrollregion hides the spare part
+            buf_h, buf_w = buf.shape[:2]
             
-            image = cv2.cvtColor(display_pano, cv2.COLOR_BGR2RGB)
-            image = Image.fromarray(image)
-            photo = ImageTk.PhotoImage(image)
+            # Same as the camera preview, only make a new PhotoImage when the buffer grows.
+            # The canvas item is made once and just pointed at the new image, recreating items is slow in Tk
+            if self._pano_photo is None or (self._pano_photo.width(), self._pano_photo.height()) != (buf_w, buf_h):
+                buf[:, new_w:] = 0
+                image = Image.frombuffer('RGB', (buf_w, buf_h), buf, 'raw', 'BGR', 0, 1)
+                self._pano_photo = ImageTk.PhotoImage(image)
+                if self._pano_image_id is not None:
+                    self.pano_canvas.itemconfig(self._pano_image_id, image=self._pano_photo)
+                self.pano_canvas.image = self._pano_photo
+            else:
+                # paste() always writes from the top left corner, so hand Tk the used width of the buffer
+                # rather than the whole thing. If the panorama got narrower the old leftovers need blacking out too
+                paste_w = max(new_w, self._pano_display_w)
+                buf[:, new_w:paste_w] = 0
+                image = Image.frombuffer('RGB', (paste_w, buf_h), buf, 'raw', 'BGR', buf.strides[0], 1)
+                self._pano_photo.paste(image)
+            self._pano_display_w = new_w
             
-            self.pano_canvas.create_image(0, 0, anchor=tk.NW, image=photo)
-            self.pano_canvas.image = photo
+            if self._pano_image_id is None:
+                # First panorama since a start or clear, swap the placeholder text for the image
+                self.pano_canvas.delete("all")
+                self._pano_image_id = self.pano_canvas.create_image(0, 0, anchor=tk.NW, image=self._pano_photo)
             
-            self.pano_canvas.configure(scrollregion=self.pano_canvas.bbox("all"))
+            self.pano_canvas.configure(scrollregion=(0, 0, new_w, new_h))
             
             # For 360-degree panoramas, don't auto-scroll to the end
             if not self.enable_360_mode:
@@ -633,6 +1355,7 @@ class ContinuousPanoramaGUI:
             return
             
         self.auto_mode = False
+        self.wake_workers()
         
         filename = filedialog.asksaveasfilename(
             defaultextension=".jpg",
@@ -641,19 +1364,93 @@ class ContinuousPanoramaGUI:
         )
         
         if filename:
+            # Stitches only ever swap in a new array, they never write into the old one, so the
+            # reference can be saved without holding panorama_lock for the whole encode
             with self.panorama_lock:
-                cv2.imwrite(filename, self.current_panorama)
-            messagebox.showinfo("Success", f"Panorama saved as {filename}")
+                panorama = self.current_panorama
+            with self.frames_lock:
+                # Copies, captures can carry on and overwrite ring buffer slots while the writer stitches
+                frame_list = [f.copy() for f in self.frames]
+            self.status_label.configure(text="Saving panorama...")
+            if self.writer_thread is None:
+                self.writer_thread = threading.Thread(target=self.writer_loop, daemon=True)
+                self.writer_thread.start()
+            self.writer_queue.put((filename, panorama, frame_list, self.total_frames))
+        else:
+            self.status_label.configure(text=f"Capture ended\n{self.total_frames} frames used")
             
-        self.status_label.configure(text=f"Capture ended\nPanorama saved\n{self.total_frames} frames used")
         self.stitch_status_label.configure(text="Stitching: Complete", fg='#34C759')
         
+    def writer_loop(self):
+        # One thread does all the saving, so saves never block the UI and never run on top of each other
+        while True:
+            job = self.writer_queue.get()
+            try:
+                self.save_panorama(*job)
+            except Exception as e:
+                print(f"Writer error: {e}")
+            finally:
+                self.writer_queue.task_done()
+            
+    def save_panorama(self, filename, panorama, frame_list, frame_count):
+        """Encode and write the panorama, runs on the writer thread so the UI keeps going"""
+        refined = False
+        if len(frame_list) >= self.min_frames_before_stitch:
+            # The live preview cut corners (homography chain or the fast stitcher), so give the saved
+            # panorama one full cv2.Stitcher pass with bundle adjustment and proper blending
+            self._ui(lambda: self.stitch_status_label.configure(text="Stitching: Final pass...", fg='#FF9500'))
+            if self.hq_stitcher is None:
+                self.hq_stitcher = cv2.Stitcher.create(cv2.Stitcher_PANORAMA)
+            images = [cv2.UMat(f) for f in frame_list] if self.use_opencl else frame_list
+            status, result = self.hq_stitcher.stitch(images)
+            if status == cv2.Stitcher_OK:
+                panorama = result.get() if isinstance(result, cv2.UMat) else result
+                refined = True
+            else:
+                print(f"Final stitch failed, saving the live panorama: {self.get_stitch_error_message(status)}")
+            self._ui(lambda: self.stitch_status_label.configure(text="Stitching: Complete", fg='#34C759'))
+            
+        if self.enable_360_mode:
+            # Only the saved panorama gets cropped, on a drifting live panorama every restitch could cut a lot away
+            panorama = self.post_process_360_panorama(panorama)
+        if refined:
+            with self.panorama_lock:
+                self.current_panorama = panorama
+            self._ui(lambda: self.update_panorama_display(panorama))
+            
+        params = []
+        if filename.lower().endswith(('.jpg', '.jpeg')):
+            # Quality 90 without the extra huffman optimization pass is plenty and a lot quicker to encode
+            params = [cv2.IMWRITE_JPEG_QUALITY, 90, cv2.IMWRITE_JPEG_OPTIMIZE, 0]
+        try:
+            ok = cv2.imwrite(filename, panorama, params)
+        except cv2.error as e:
+            print(f"Save error: {e}")
+            ok = False
+            
+        if ok:
+            self._ui(lambda: messagebox.showinfo("Success", f"Panorama saved as {filename}"))
+            self._ui(lambda: self.status_label.configure(text=f"Capture ended\nPanorama saved\n{frame_count} frames used"))
+        else:
+            self._ui(lambda: messagebox.showerror("Error", f"Couldn't save panorama to {filename}"))
+        
     def clear_panorama(self):
-        self.frames.clear()
+        with self.frames_lock:
+            self.frames.clear()
+            self.frame_features.clear()
+            self.frame_umats.clear()
+            # Drop the buffer rather than reuse it, a stitch in flight may still be reading it
+            self._frames_buf = None
         self.current_panorama = None
         self.total_frames = 0
+        self.previous_scene_thumb = None
+        self._best_candidate = None
+        self._candidates_checked = 0
+        self._first_frame_feats = None
+        self.reset_stitch_state()
         
         self.pano_canvas.delete("all")
+        self._pano_image_id = None
         self.pano_canvas.create_text(400, 150, text="Panorama will grow here as frames are captured",
                                    font=('SF Pro Display', 16), fill='#3a3a3c')
         
@@ -680,10 +1477,10 @@ class ContinuousPanoramaGUI:
         tk.Label(settings_window, text="'webcam' for device camera or MJPEG URL for ROV",
                 font=('SF Pro Display', 10), bg='#1c1c1e', fg='#8e8e93').pack(pady=(2,15))
         
-        tk.Label(settings_window, text="Scene Change Threshold:", 
+        tk.Label(settings_window, text="Scene Change Threshold (% of frame moved, 40% max):", 
                 bg='#1c1c1e', fg='#ffffff', font=('SF Pro Display', 12)).pack(pady=(10,5))
         threshold_var = tk.DoubleVar(value=self.scene_change_threshold)
-        threshold_scale = tk.Scale(settings_window, from_=10.0, to=80.0, resolution=5.0,
+        threshold_scale = tk.Scale(settings_window, from_=self.scene_change_range[0], to=self.scene_change_range[1], resolution=5.0,
                                  variable=threshold_var, orient=tk.HORIZONTAL, 
                                  bg='#2c2c2e', fg='#ffffff', font=('SF Pro Display', 10))
         threshold_scale.pack(fill=tk.X, padx=20, pady=5)
@@ -714,7 +1511,8 @@ class ContinuousPanoramaGUI:
         
         def apply_settings():
             self.camera_source = source_var.get().strip()
-            self.scene_change_threshold = threshold_var.get()
+            low, high = self.scene_change_range
+            self.scene_change_threshold = min(high, max(low, threshold_var.get()))
             self.capture_interval = interval_var.get()
             self.brightness = brightness_var.get()
             self.contrast = contrast_var.get()
@@ -726,10 +1524,25 @@ class ContinuousPanoramaGUI:
                  font=('SF Pro Display', 14, 'bold'), height=2).pack(pady=30)
         
     def on_closing(self):
+        if self._closing:
+            # Already shutting down and waiting on a save
+            return
+        self._closing = True
         self.running = False
         self.auto_mode = False
+        self.wake_workers()
+        self._feature_pool.shutdown(wait=False)
         if self.cap:
             self.cap.release()
+        self.finish_closing()
+        
+    def finish_closing(self):
+        # The writer is a daemon thread, so closing mid-save would kill it and lose the panorama.
+        # Keep Tk running (the writer still posts its updates through it) and check back until it's done
+        if self.writer_queue.unfinished_tasks:
+            self.status_label.configure(text="Saving panorama...\nClosing once it's written")
+            self.root.after(100, self.finish_closing)
+            return
         self.root.destroy()
 
 def main():
@@ -2,6 +2,53 @@ import cv2
 import numpy as np
 import argparse
 import sys
+import math
+
+try:
+    import numba
+except ImportError:  # numba is optional, generate_maps falls back to numpy without it
+    numba = None
+
+if numba is not None:
+    @numba.njit(parallel=True, fastmath=True, cache=True)
+    def _build_maps_kernel(view_w, view_h, fov, yaw, pitch, img_w, img_h, elev_range, map_x, map_y):
+        # Same math as the numpy path in generate_maps, one pass per pixel with no full size temporaries.
+        # Everything is kept in float32 like the numpy path, the trig is a lot cheaper that way
+        f32 = np.float32
+        focal_length = f32(1.0 / math.tan(math.radians(fov) / 2))
+        cos_yaw, sin_yaw = f32(math.cos(math.radians(yaw))), f32(math.sin(math.radians(yaw)))
+        cos_pitch, sin_pitch = f32(math.cos(math.radians(pitch))), f32(math.sin(math.radians(pitch)))
+        half_w, half_h = f32(view_w / 2), f32(view_h / 2)
+        scale_x, scale_y = f32(img_w / (2 * math.pi)), f32(img_h / elev_range)
+        max_x, max_y = f32(img_w - 1), f32(img_h - 1)
+        for v in numba.prange(view_h):
+            y = (f32(v) - half_h) / half_h / focal_length
+            for u in range(view_w):
+                x = (f32(u) - half_w) / half_w / focal_length
+                inv_norm = f32(1.0) / math.sqrt(x * x + y * y + f32(1.0))
+                xn = x * inv_norm
+                yn = y * inv_norm
+                zn = inv_norm
+                
+                x_rot = xn * cos_yaw + zn * sin_yaw
+                z_rot = -xn * sin_yaw + zn * cos_yaw
+                y_final = yn * cos_pitch - z_rot * sin_pitch
+                z_final = yn * sin_pitch + z_rot * cos_pitch
+                
+                azimuth = math.atan2(x_rot, z_final)
+                elevation = math.asin(min(max(y_final, f32(-1.0)), f32(1.0)))
+                
+                src_x = (azimuth + f32(math.pi)) * scale_x
+                src_y = (elevation + f32(elev_range / 2)) * scale_y
+                map_x[v, u] = min(max(src_x, f32(0.0)), max_x)
+                map_y[v, u] = min(max(src_y, f32(0.0)), max_y)
+
+# The kernel works out the trig one pixel at a time while numpy's vectorized trig is quicker on a
+# single core, so only take the numba path when it actually gets to spread over several threads
+if numba is not None and numba.config.NUMBA_NUM_THREADS >= 2:
+    _build_maps = _build_maps_kernel
+else:
+    _build_maps = None
 
 class CylindricalViewer:
     def __init__(self, image_path):
@@ -11,10 +58,25 @@ class CylindricalViewer:
         
         self.height, self.width = self.image.shape[:2]
         
+        # Half size copies of the image, generate_maps samples from whichever one has about as many
+        # pixels per degree as the view so wide FOVs don't alias and remap reads less memory
+        self._pyr = [self.image]
+        while min(self._pyr[-1].shape[:2]) > 256:
+            self._pyr.append(cv2.pyrDown(self._pyr[-1]))
+        self.source = self.image
+        
+        # With OpenCL the pyramid and the maps live on the GPU and remap runs there, only the
+        # finished view comes back for imshow
+        self.use_opencl = cv2.ocl.haveOpenCL()
+        if self.use_opencl:
+            self._pyr_umats = [cv2.UMat(level) for level in self._pyr]
+        
         # Viewer parameters
         self.view_width = 800
         self.view_height = 600
         self.fov = 90  # Field of view in degrees
+        # For cylindrical images, typically the full height represents a limited vertical range
+        self.elevation_range = np.pi / 3  # Adjust this based on your image's vertical coverage
         
         # Navigation parameters
         self.yaw = 0.0  # Horizontal rotation
@@ -31,8 +93,17 @@ class CylindricalViewer:
         cv2.namedWindow('Cylindrical Viewer', cv2.WINDOW_AUTOSIZE)
         cv2.setMouseCallback('Cylindrical Viewer', self.mouse_callback)
         
+        # Camera space rays, rebuilt by generate_maps whenever the view size or FOV changes
+        self._rays_key = None
+        self._level_key = None
+        
+        # Float maps generate_maps writes into, reallocated only if the view size changes
+        self.map_x = np.empty((self.view_height, self.view_width), np.float32)
+        self.map_y = np.empty((self.view_height, self.view_width), np.float32)
+        
         # Generate coordinate maps
         self.generate_maps()
+        self._maps_dirty = False
     
     def mouse_callback(self, event, x, y, flags, param):
         if event == cv2.EVENT_LBUTTONDOWN:
@@ -41,9 +112,13 @@ class CylindricalViewer:
             self.mouse_y = y
         elif event == cv2.EVENT_LBUTTONUP:
             self.mouse_pressed = False
+            # Redraw the resting view with linear interpolation
+            self._maps_dirty = True
         elif event == cv2.EVENT_MOUSEMOVE and self.mouse_pressed:
             dx = x - self.mouse_x
             dy = y - self.mouse_y
+            if dx == 0 and dy == 0:
+                return
             
             # Update yaw and pitch based on mouse movement
             self.yaw += dx * self.sensitivity
@@ -58,14 +133,23 @@ class CylindricalViewer:
             self.mouse_x = x
             self.mouse_y = y
             
-            # Regenerate maps with new view angles
-            self.generate_maps()
+            # Just flag the maps, run() rebuilds them once per tick no matter how many moves came in
+            self._maps_dirty = True
     
-    def generate_maps(self):
-        # Create coordinate grids for the output view
+    def view_moved(self):
+        # Anything under about a pixel's worth of angle gives the same maps, so don't bother rebuilding
+        built_yaw, built_pitch, built_fov = self._built_view
+        if self.fov != built_fov:
+            return True
+        min_delta = self.fov / self.view_width
+        yaw_delta = (self.yaw - built_yaw + 180) % 360 - 180
+        return abs(yaw_delta) >= min_delta or abs(self.pitch - built_pitch) >= min_delta
+    
+    def build_camera_rays(self):
+        # Ray directions in camera space only depend on the view size and FOV, not on yaw/pitch,
+        # so they're worked out once here and generate_maps just rotates them
         u = np.arange(self.view_width, dtype=np.float32)
         v = np.arange(self.view_height, dtype=np.float32)
-        u, v = np.meshgrid(u, v)
         
         # Convert to normalized coordinates (-1 to 1)
         u_norm = (u - self.view_width / 2) / (self.view_width / 2)
@@ -76,34 +160,79 @@ class CylindricalViewer:
         
         # Calculate 3D coordinates on unit sphere
         # Perspective projection
-        focal_length = 1.0 / np.tan(fov_rad / 2)
+        focal_length = np.float32(1.0 / np.tan(fov_rad / 2))
         
-        x = u_norm / focal_length
-        y = v_norm / focal_length
-        z = np.ones_like(x)
+        # x only changes along a row and y only down a column, so broadcast them instead of a meshgrid
+        x = (u_norm / focal_length)[None, :]
+        y = (v_norm / focal_length)[:, None]
         
         # Normalize to unit sphere
-        norm = np.sqrt(x*x + y*y + z*z)
-        x /= norm
-        y /= norm
-        z /= norm
+        inv_norm = 1.0 / np.sqrt(x*x + y*y + 1.0)
+        self.ray_x = x * inv_norm
+        self.ray_y = y * inv_norm
+        self.ray_z = inv_norm
+        self._scratch = [np.empty((self.view_height, self.view_width), np.float32) for _ in range(2)]
+        self._rays_key = (self.view_width, self.view_height, self.fov)
+        
+    def pick_source(self):
+        # Source pixels per view pixel across the middle of the view, each level halves it
+        ratio = self.width * self.fov / (360 * self.view_width)
+        level = min(int(math.log2(ratio)) if ratio >= 2 else 0, len(self._pyr) - 1)
+        self.source = self._pyr[level]
+        if self.use_opencl:
+            self._source_umat = self._pyr_umats[level]
+        return self.source.shape[1], self.source.shape[0]
+    
+    def generate_maps(self):
+        self._built_view = (self.yaw, self.pitch, self.fov)
+        img_w, img_h = self.pick_source()
+        if self.map_x.shape != (self.view_height, self.view_width):
+            self.map_x = np.empty((self.view_height, self.view_width), np.float32)
+            self.map_y = np.empty((self.view_height, self.view_width), np.float32)
+        map_x, map_y = self.map_x, self.map_y
+        
+        if self.pitch == 0:
+            self.pan_maps(img_w, img_h)
+            return
+        
+        if _build_maps is not None:
+            _build_maps(self.view_width, self.view_height, float(self.fov), float(self.yaw), float(self.pitch),
+                        img_w, img_h, self.elevation_range, map_x, map_y)
+            self.store_maps(map_x, map_y)
+            return
+        
+        if self._rays_key != (self.view_width, self.view_height, self.fov):
+            self.build_camera_rays()
+        x, y, z = self.ray_x, self.ray_y, self.ray_z
+        # Everything below works in place in these two plus the map buffers, so a rebuild doesn't
+        # allocate a pile of view sized temporaries
+        s1, s2 = self._scratch
         
         # Apply rotation based on yaw and pitch
         yaw_rad = np.radians(self.yaw)
         pitch_rad = np.radians(self.pitch)
         
         # Rotation matrices
-        cos_yaw, sin_yaw = np.cos(yaw_rad), np.sin(yaw_rad)
-        cos_pitch, sin_pitch = np.cos(pitch_rad), np.sin(pitch_rad)
+        cos_yaw, sin_yaw = np.float32(np.cos(yaw_rad)), np.float32(np.sin(yaw_rad))
+        cos_pitch, sin_pitch = np.float32(np.cos(pitch_rad)), np.float32(np.sin(pitch_rad))
         
         # Apply yaw rotation (around Y axis)
-        x_rot = x * cos_yaw + z * sin_yaw
-        z_rot = -x * sin_yaw + z * cos_yaw
+        # x_rot = x * cos_yaw + z * sin_yaw -> s1
+        x_rot = np.multiply(x, cos_yaw, out=s1)
+        x_rot += np.multiply(z, sin_yaw, out=map_x)
+        # z_rot = -x * sin_yaw + z * cos_yaw -> s2
+        z_rot = np.multiply(z, cos_yaw, out=s2)
+        z_rot -= np.multiply(x, sin_yaw, out=map_x)
         y_rot = y
         
         # Apply pitch rotation (around X axis)
-        y_final = y_rot * cos_pitch - z_rot * sin_pitch
-        z_final = y_rot * sin_pitch + z_rot * cos_pitch
+        # y_final = y_rot * cos_pitch - z_rot * sin_pitch -> map_y
+        y_final = np.multiply(y_rot, cos_pitch, out=map_y)
+        y_final -= np.multiply(z_rot, sin_pitch, out=map_x)
+        # z_final = y_rot * sin_pitch + z_rot * cos_pitch -> s2
+        z_final = z_rot
+        z_final *= cos_pitch
+        z_final += np.multiply(y_rot, sin_pitch, out=map_x)
         x_final = x_rot
         
         # Convert to cylindrical coordinates
@@ -111,29 +240,73 @@ class CylindricalViewer:
         # - azimuth (horizontal angle) to image width
         # - height (y coordinate) to image height
         
-        azimuth = np.arctan2(x_final, z_final)
-        elevation = np.arcsin(np.clip(y_final, -1, 1))
+        azimuth = np.arctan2(x_final, z_final, out=map_x)
+        elevation = np.arcsin(np.clip(y_final, -1, 1, out=y_final), out=y_final)
         
         # Convert to image coordinates
         # Map azimuth from [-π, π] to [0, width]
-        src_x = ((azimuth + np.pi) / (2 * np.pi)) * self.width
+        src_x = azimuth
+        src_x += np.float32(np.pi)
+        src_x *= np.float32(img_w / (2 * np.pi))
         
         # Map elevation from [-π/2, π/2] to [0, height]
-        # For cylindrical images, typically the full height represents a limited vertical range
-        elevation_range = np.pi / 3  # Adjust this based on your image's vertical coverage
-        src_y = ((elevation + elevation_range/2) / elevation_range) * self.height
+        elevation_range = self.elevation_range
+        src_y = elevation
+        src_y += np.float32(elevation_range / 2)
+        src_y *= np.float32(img_h / elevation_range)
         
         # Clamp coordinates to image bounds
-        src_x = np.clip(src_x, 0, self.width - 1)
-        src_y = np.clip(src_y, 0, self.height - 1)
+        np.clip(src_x, 0, img_w - 1, out=src_x)
+        np.clip(src_y, 0, img_h - 1, out=src_y)
         
-        # Store maps for remapping
-        self.map_x = src_x.astype(np.float32)
-        self.map_y = src_y.astype(np.float32)
+        self.store_maps(src_x, src_y)
+    
+    def pan_maps(self, img_w, img_h):
+        # With no pitch, yaw is just an offset on the azimuth and the source rows don't change at all,
+        # so keep the yaw 0 maps around and panning is an add and a mod instead of all the trig
+        if self._rays_key != (self.view_width, self.view_height, self.fov):
+            self.build_camera_rays()
+        if self._level_key != (self._rays_key, img_w, img_h):
+            self._level_azimuth = np.arctan2(self.ray_x, self.ray_z)
+            src_y = np.arcsin(self.ray_y)
+            src_y += np.float32(self.elevation_range / 2)
+            src_y *= np.float32(img_h / self.elevation_range)
+            self._level_src_y = np.clip(src_y, 0, img_h - 1, out=src_y)
+            self._level_key = (self._rays_key, img_w, img_h)
+        
+        # Same as the full path, azimuth + yaw + π lands in [0, 4π) so one wrap brings it back to [0, 2π).
+        # np.mod would do it too but is far slower than a masked subtract
+        src_x = np.add(self._level_azimuth, np.float32(np.radians(self.yaw % 360) + np.pi), out=self.map_x)
+        two_pi = np.float32(2 * np.pi)
+        np.subtract(src_x, two_pi, out=src_x, where=src_x >= two_pi)
+        src_x *= np.float32(img_w / (2 * np.pi))
+        np.clip(src_x, 0, img_w - 1, out=src_x)
+        self.store_maps(src_x, self._level_src_y)
+    
+    def store_maps(self, src_x, src_y):
+        # Store maps for remapping, packed into fixed point so remap reads half the data
+        # and can take its integer interpolation path
+        self.map1, self.map2 = cv2.convertMaps(src_x, src_y, cv2.CV_16SC2)
+        if self.use_opencl:
+            # Upload once per view change rather than on every redraw
+            self._map1_umat = cv2.UMat(self.map1)
+            self._map2_umat = cv2.UMat(self.map2)
     
     def render_view(self):
         # Use remap to sample the cylindrical image
-        view = cv2.remap(self.image, self.map_x, self.map_y, 
+        if self.use_opencl:
+            if self.mouse_pressed:
+                view = cv2.remap(self._source_umat, self._map1_umat, None,
+                                cv2.INTER_NEAREST, borderMode=cv2.BORDER_WRAP)
+            else:
+                view = cv2.remap(self._source_umat, self._map1_umat, self._map2_umat,
+                                cv2.INTER_LINEAR, borderMode=cv2.BORDER_WRAP)
+            return view.get()
+        if self.mouse_pressed:
+            # Nearest is plenty while dragging and only needs the integer half of the maps
+            return cv2.remap(self.source, self.map1, None,
+                            cv2.INTER_NEAREST, borderMode=cv2.BORDER_WRAP)
+        view = cv2.remap(self.source, self.map1, self.map2, 
                         cv2.INTER_LINEAR, borderMode=cv2.BORDER_WRAP)
         return view
     
@@ -145,44 +318,54 @@ class CylindricalViewer:
         print("- Press 'r' to reset view")
         print("- Press '+'/'-' to adjust FOV")
         
+        # Draw the first frame straight away, after that only redraw when something changed
+        self._maps_dirty = True
+        
         while True:
-            # Render the current view
-            view = self.render_view()
-            
-            # Add UI overlay
-            info_text = f"Yaw: {self.yaw:.1f} Pitch: {self.pitch:.1f} FOV: {self.fov}"
-            cv2.putText(view, info_text, (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 
-                       0.7, (255, 255, 255), 2)
-            cv2.putText(view, info_text, (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 
-                       0.7, (0, 0, 0), 1)
-            
-            cv2.imshow('Cylindrical Viewer', view)
+            if self._maps_dirty:
+                # Rebuild the maps if the view moved since last redraw
+                if self.view_moved():
+                    self.generate_maps()
+                self._maps_dirty = False
+                
+                # Render the current view
+                view = self.render_view()
+                
+                # Add UI overlay
+                info_text = f"Yaw: {self.yaw:.1f} Pitch: {self.pitch:.1f} FOV: {self.fov}"
+                cv2.putText(view, info_text, (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 
+                           0.7, (255, 255, 255), 2)
+                cv2.putText(view, info_text, (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 
+                           0.7, (0, 0, 0), 1)
+                
+                cv2.imshow('Cylindrical Viewer', view)
             
-            key = cv2.waitKey(1) & 0xFF
+            # ~60 Hz is plenty for input, no point spinning at 1 kHz showing the same frame
+            key = cv2.waitKey(16) & 0xFF
             if key == ord('q') or key == 27:  # 'q' or ESC
                 break
             elif key == ord('r'):  # Reset view
                 self.yaw = 0.0
                 self.pitch = 0.0
-                self.generate_maps()
+                self._maps_dirty = True
             elif key == ord('+') or key == ord('='):  # Increase FOV
                 self.fov = min(self.fov + 5, 150)
-                self.generate_maps()
+                self._maps_dirty = True
             elif key == ord('-'):  # Decrease FOV
                 self.fov = max(self.fov - 5, 30)
-                self.generate_maps()
+                self._maps_dirty = True
             elif key == 81:  # Left arrow
                 self.yaw = (self.yaw - 5) % 360
-                self.generate_maps()
+                self._maps_dirty = True
             elif key == 83:  # Right arrow
                 self.yaw = (self.yaw + 5) % 360
-                self.generate_maps()
+                self._maps_dirty = True
             elif key == 82:  # Up arrow
                 self.pitch = np.clip(self.pitch + 5, -self.max_pitch, self.max_pitch)
-                self.generate_maps()
+                self._maps_dirty = True
             elif key == 84:  # Down arrow
                 self.pitch = np.clip(self.pitch - 5, -self.max_pitch, self.max_pitch)
-                self.generate_maps()
+                self._maps_dirty = True
 
         cv2.destroyAllWindows()
 